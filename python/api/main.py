@@ -1,8 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from predict import MentalHealthPredictor
+from predict import MAX_BATCH_SIZE, MentalHealthPredictor
 import uvicorn
+import asyncio
 import os
 
 # Initialize FastAPI app
@@ -36,15 +37,66 @@ CATEGORY_DESCRIPTIONS = {
     "wellbeing": "ข้อความเชิงบวกหรือความเป็นอยู่ที่ดี แสดงถึงสุขภาวะที่ดี",
 }
 
-# Initialize predictor (will load model on startup)
+# Initialize predictor (loaded in the background on startup so the server can answer /health meanwhile)
 MODEL_DIR = os.getenv("MENTAL_MODEL_DIR")
 if MODEL_DIR:
     print(f"?o. Using custom model directory: {MODEL_DIR}")
-try:
-    predictor = MentalHealthPredictor(model_dir=MODEL_DIR)
-except Exception as e:
-    print(f"??O Error loading model: {e}")
-    predictor = None
+
+# Dynamic batching: concurrent /predict requests are queued and served by a
+# single worker that runs one tokenize + forward pass for up to MAX_BATCH_SIZE texts
+# (imported from predict so the cap always matches the TensorRT / CUDA-graph batch shapes)
+BATCH_TIMEOUT_MS = float(os.getenv("MENTAL_BATCH_TIMEOUT_MS", "10"))
+
+async def server_loop(predictor: MentalHealthPredictor, queue: asyncio.Queue):
+    """Drain the request queue in batches and resolve each request's future"""
+    loop = asyncio.get_running_loop()
+    while True:
+        text, future = await queue.get()
+        texts, futures = [text], [future]
+        deadline = loop.time() + BATCH_TIMEOUT_MS / 1000
+        while len(texts) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                text, future = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            texts.append(text)
+            futures.append(future)
+        
+        try:
+            # Run the forward pass off the event loop so new requests keep queueing
+            results = await loop.run_in_executor(None, predictor.predict_batch, texts)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+async def load_predictor():
+    """Load the model weights in a worker thread, then start the batching worker"""
+    loop = asyncio.get_running_loop()
+    try:
+        predictor = await loop.run_in_executor(None, MentalHealthPredictor, MODEL_DIR)
+    except Exception as e:
+        print(f"??O Error loading model: {e}")
+        return
+    app.state.predictor = predictor
+    app.state.batch_worker = asyncio.create_task(server_loop(predictor, app.state.request_queue))
+
+@app.on_event("startup")
+async def startup():
+    """Start loading the model without blocking server readiness"""
+    app.state.predictor = None
+    app.state.request_queue = asyncio.Queue()
+    app.state.model_loader = asyncio.create_task(load_predictor())
+
+def model_loading() -> bool:
+    return not app.state.model_loader.done()
 
 # Request model
 class PredictionRequest(BaseModel):
@@ -63,7 +115,7 @@ async def root():
     return {
         "status": "running",
         "message": "Mental Health Prediction API",
-        "model_loaded": predictor is not None,
+        "model_loaded": app.state.predictor is not None,
         "categories": CATEGORY_DESCRIPTIONS,
     }
 
@@ -76,14 +128,18 @@ async def predict(request: PredictionRequest):
     
     Returns prediction, confidence score, and probabilities for all categories
     """
-    if predictor is None:
+    if app.state.predictor is None:
+        if model_loading():
+            raise HTTPException(status_code=503, detail="Model is still loading. Please try again shortly.")
         raise HTTPException(
             status_code=500, 
             detail="Model not loaded. Please train the model first by running the notebook."
         )
     
     try:
-        result = predictor.predict(request.text)
+        future = asyncio.get_running_loop().create_future()
+        await app.state.request_queue.put((request.text, future))
+        result = await future
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
@@ -92,6 +148,7 @@ async def predict(request: PredictionRequest):
 async def health():
     """Detailed health check"""
     available_categories = list(CATEGORY_DESCRIPTIONS.keys())
+    predictor = app.state.predictor
     if predictor:
         # Get categories from id2label mapping (transformer model)
         model_categories = list(predictor.id2label.values()) if hasattr(predictor, 'id2label') else []
@@ -99,7 +156,7 @@ async def health():
         available_categories = sorted(set(available_categories) | set(model_categories))
     
     return {
-        "status": "healthy" if predictor is not None else "unhealthy",
+        "status": "healthy" if predictor is not None else ("loading" if model_loading() else "unhealthy"),
         "model_loaded": predictor is not None,
         "available_categories": available_categories,
         "category_details": CATEGORY_DESCRIPTIONS,
@@ -2,15 +2,24 @@ import re
 import string
 import json
 import os
+import subprocess
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List
 
 # Fix OpenMP duplicate library warning
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
+import numpy as np
 import torch
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 
+MAX_LENGTH = 256
+MAX_BATCH_SIZE = int(os.getenv("MENTAL_MAX_BATCH_SIZE", "32"))
+_WS_RE = re.compile(r"\s+")
+CACHE_SIZE = int(os.getenv("MENTAL_PREDICTION_CACHE_SIZE", "2048"))
+
 class MentalHealthPredictor:
     """Class for loading transformer model and making predictions"""
     
@@ -27,6 +36,10 @@ class MentalHealthPredictor:
             # Go up two levels to project root, then into model folder
             model_dir = os.path.join(os.path.dirname(os.path.dirname(current_dir)), "model", "transformer_bert_base")
         
+        # LRU cache of results keyed on preprocessed text (0 disables it)
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
         model_path = Path(model_dir)
         label_map_path = model_path / "label_map.json"
         
@@ -42,29 +55,308 @@ class MentalHealthPredictor:
                 # Fallback to default labels (5 classes including wellbeing)
                 self.id2label = {0: "Anxiety", 1: "SuicideWatch", 2: "depression", 3: "mentalhealth", 4: "wellbeing"}
                 self.label2id = {v: k for k, v in self.id2label.items()}
+            # Labels indexed by class id, so predictions index a list instead of a dict
+            self.labels = [self.id2label[i] for i in range(len(self.id2label))]
             
             # Load model and tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
-            self.model = AutoModelForSequenceClassification.from_pretrained(model_dir)
-            self.model.eval()  # Set to evaluation mode
+            self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+            self.quantized = False
+            self.compiled = False
+            self.traced = False
+            self._graph = None
             
-            # Move to GPU if available
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            self.model.to(self.device)
+            # MENTAL_MODEL_BACKEND=onnx serves an INT8 ONNX Runtime export on CPU,
+            # MENTAL_MODEL_BACKEND=tensorrt serves a TensorRT FP16 engine on GPU, instead of PyTorch
+            self.backend = os.getenv("MENTAL_MODEL_BACKEND", "torch").lower()
+            if self.backend == "onnx":
+                self.device = "cpu"
+                self.model = self._load_onnx_model(model_path)
+                self.quantized = True
+            elif self.backend == "tensorrt":
+                if not torch.cuda.is_available():
+                    raise RuntimeError("TensorRT backend requires a CUDA GPU")
+                self.device = "cuda"
+                self.model = self._load_tensorrt_engine(model_path)
+            else:
+                # Use GPU if available
+                self.device = "cuda" if torch.cuda.is_available() else "cpu"
+                
+                # safetensors checkpoints are memory-mapped, so worker processes share the page cache;
+                # on GPU the FP16 weights (half the bandwidth, tensor-core GEMMs) stream straight to the device
+                load_kwargs = {"low_cpu_mem_usage": True}
+                if (model_path / "model.safetensors").exists():
+                    load_kwargs["use_safetensors"] = True
+                if self.device == "cuda":
+                    load_kwargs.update(torch_dtype=torch.float16, device_map=self.device)
+                use_cuda_graph = (
+                    self.device == "cuda"
+                    and os.getenv("MENTAL_MODEL_COMPILE", "0") != "1"
+                    and os.getenv("MENTAL_MODEL_CUDA_GRAPH", "0") == "1"
+                )
+                if use_cuda_graph:
+                    # The SDPA mask helper branches on `torch.all(mask == 1)`, a host sync that
+                    # aborts stream capture; the eager attention mask path has no data-dependent branch
+                    load_kwargs["attn_implementation"] = "eager"
+                self.model = AutoModelForSequenceClassification.from_pretrained(model_dir, **load_kwargs)
+                self.model.eval()  # Set to evaluation mode
+                
+                # On CPU, quantize Linear weights to INT8 (FBGEMM kernels); set MENTAL_MODEL_QUANTIZE=0 to keep FP32
+                if self.device == "cpu" and os.getenv("MENTAL_MODEL_QUANTIZE", "1") != "0":
+                    if "fbgemm" in torch.backends.quantized.supported_engines:
+                        torch.backends.quantized.engine = "fbgemm"
+                    self.model = torch.quantization.quantize_dynamic(
+                        self.model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                    self.quantized = True
+                
+                # On CPU, optionally trace + freeze the model so the oneDNN graph fuser can fuse
+                # Linear/GELU/LayerNorm across layers; enable with MENTAL_MODEL_JIT=1
+                if self.device == "cpu" and os.getenv("MENTAL_MODEL_JIT", "0") == "1":
+                    self._trace_cpu()
+                
+                # On CUDA, optionally quantize weights (FP8 on Ada/Hopper, INT8 otherwise) and compile with
+                # Inductor so dequant + GEMM fuse into a single kernel; enable with MENTAL_MODEL_COMPILE=1
+                if self.device == "cuda" and os.getenv("MENTAL_MODEL_COMPILE", "0") == "1":
+                    self.quantized = self._quantize_cuda()
+                    self.model = torch.compile(self.model, mode="reduce-overhead", fullgraph=True)
+                    self.compiled = True
+                    self._warmup()
+                
+                # On CUDA, optionally capture a fixed-shape (MAX_BATCH_SIZE x MAX_LENGTH) forward as a CUDA graph
+                # so each batch is one graph replay instead of hundreds of kernel launches; enable with
+                # MENTAL_MODEL_CUDA_GRAPH=1 (compiled models already use CUDA graphs via reduce-overhead)
+                if use_cuda_graph:
+                    self._capture_cuda_graph(model_dir, load_kwargs)
             
             print(f"✅ Model loaded successfully from {model_dir}")
-            print(f"✅ Using device: {self.device}")
+            print(f"✅ Using device: {self.device} ({self.backend} backend)" + (" (quantized)" if self.quantized else "") + (" (compiled)" if self.compiled else "") + (" (traced)" if self.traced else "") + (" (CUDA graph)" if self._graph is not None else ""))
             print(f"✅ Model can predict: {list(self.id2label.values())}")
         except FileNotFoundError as e:
             raise Exception(f"Model files not found. Please run training first. Error: {e}")
         except Exception as e:
             raise Exception(f"Error loading model: {e}")
     
+    def _load_onnx_model(self, model_path: Path):
+        """Export the checkpoint to ONNX with INT8 dynamic quantization (once) and load it in ONNX Runtime"""
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        except ImportError as e:
+            raise ImportError("ONNX backend requires optimum: pip install optimum[onnxruntime]") from e
+        
+        onnx_dir = model_path / "onnx_int8"
+        if not (onnx_dir / "model_quantized.onnx").exists():
+            print(f"⏳ Exporting model to ONNX (INT8) at {onnx_dir}")
+            ort_model = ORTModelForSequenceClassification.from_pretrained(model_path, export=True)
+            quantizer = ORTQuantizer.from_pretrained(ort_model)
+            quantizer.quantize(
+                save_dir=onnx_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+            )
+        return ORTModelForSequenceClassification.from_pretrained(onnx_dir, file_name="model_quantized.onnx")
+    
+    def _load_tensorrt_engine(self, model_path: Path):
+        """Export to ONNX and build a TensorRT FP16 engine with trtexec (once), then load it with polygraphy"""
+        try:
+            from polygraphy.backend.common import BytesFromPath
+            from polygraphy.backend.trt import EngineFromBytes, TrtRunner
+        except ImportError as e:
+            raise ImportError("TensorRT backend requires TensorRT and polygraphy: pip install tensorrt polygraphy") from e
+        
+        trt_dir = model_path / "tensorrt_fp16"
+        engine_path = trt_dir / "model.engine"
+        if not engine_path.exists():
+            trt_dir.mkdir(parents=True, exist_ok=True)
+            onnx_path = trt_dir / "model.onnx"
+            print(f"⏳ Exporting model to ONNX at {onnx_path}")
+            model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+            example = self.tokenizer("warmup", return_tensors="pt")
+            # Pin int32 inputs: TensorRT < 10 has no int64 bindings, and _forward feeds int32 either way
+            torch.onnx.export(
+                model,
+                (example["input_ids"].to(torch.int32), example["attention_mask"].to(torch.int32)),
+                str(onnx_path),
+                input_names=["input_ids", "attention_mask"],
+                output_names=["logits"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "seq"},
+                    "attention_mask": {0: "batch", 1: "seq"},
+                    "logits": {0: "batch"},
+                },
+                opset_version=17,
+            )
+            del model
+            
+            # FP16 only: INT8 PTQ places Q/DQ nodes that block fused transformer kernels
+            print(f"⏳ Building TensorRT FP16 engine at {engine_path}")
+            shapes = {
+                "--minShapes": "1x1",
+                "--optShapes": "8x128",
+                "--maxShapes": f"{MAX_BATCH_SIZE}x{MAX_LENGTH}",
+            }
+            subprocess.run(
+                [
+                    "trtexec",
+                    f"--onnx={onnx_path}",
+                    f"--saveEngine={engine_path}",
+                    "--fp16",
+                    *(f"{flag}=input_ids:{shape},attention_mask:{shape}" for flag, shape in shapes.items()),
+                ],
+                check=True,
+            )
+        
+        runner = TrtRunner(EngineFromBytes(BytesFromPath(str(engine_path))))
+        runner.activate()
+        return runner
+    
+    def _quantize_cuda(self) -> bool:
+        """Quantize encoder Linear layers with torchao; returns False if torchao is unavailable"""
+        try:
+            from torchao.quantization import (
+                PerRow,
+                float8_dynamic_activation_float8_weight,
+                int8_weight_only,
+                quantize_,
+            )
+        except ImportError:
+            print("⚠️ torchao not installed; compiling without weight quantization")
+            return False
+        
+        if torch.cuda.get_device_capability() >= (8, 9):
+            # FP8 E4M3 tensor cores (L40S/H100): per-channel weight scales, dynamic activation scales.
+            # The classifier head stays in full precision.
+            quantize_(
+                self.model,
+                float8_dynamic_activation_float8_weight(granularity=PerRow()),
+                filter_fn=lambda module, fqn: isinstance(module, torch.nn.Linear) and not fqn.startswith("classifier"),
+            )
+            print("✅ Using FP8 (E4M3) weights and activations")
+        else:
+            quantize_(self.model, int8_weight_only())
+            print("✅ Using INT8 weight-only quantization")
+        return True
+    
+    def _trace_cpu(self):
+        """Replace the eager CPU model with a frozen TorchScript trace using oneDNN fusion"""
+        torch.jit.enable_onednn_fusion(True)
+        example = self.tokenizer(
+            "x" * 64,
+            return_tensors="pt",
+            truncation=True,
+            max_length=MAX_LENGTH,
+            padding="max_length"
+        )
+        with torch.inference_mode():
+            traced = torch.jit.trace(self.model, (example["input_ids"], example["attention_mask"]), strict=False)
+            self.model = torch.jit.freeze(traced)
+        self.traced = True
+        # oneDNN picks its kernels on the first runs
+        self._warmup()
+    
+    def _capture_cuda_graph(self, model_dir: str, load_kwargs: Dict):
+        """Capture the forward pass on static, padded input buffers; falls back to SDPA eager on failure"""
+        try:
+            self._capture_cuda_graph_unchecked()
+        except Exception as e:
+            # Losing the graph only costs speed, so keep serving. The model was loaded with eager
+            # attention just for capture; reload it with the default (SDPA) attention for the fallback
+            print(f"⚠️ CUDA graph capture failed ({e}); reloading with SDPA attention and serving without a graph")
+            self._graph = None
+            self._static_inputs = None
+            self._static_logits = None
+            torch.cuda.synchronize()
+            self.model = None
+            torch.cuda.empty_cache()
+            sdpa_kwargs = {k: v for k, v in load_kwargs.items() if k != "attn_implementation"}
+            self.model = AutoModelForSequenceClassification.from_pretrained(model_dir, **sdpa_kwargs)
+            self.model.eval()
+    
+    def _capture_cuda_graph_unchecked(self):
+        shape = (MAX_BATCH_SIZE, MAX_LENGTH)
+        self._static_inputs = {
+            "input_ids": torch.zeros(shape, dtype=torch.long, device=self.device),
+            "attention_mask": torch.zeros(shape, dtype=torch.long, device=self.device),
+        }
+        self._graph_lock = threading.Lock()
+        # Warm up on a side stream before capture, as CUDA graph capture requires
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream), torch.inference_mode():
+            for _ in range(3):
+                self.model(**self._static_inputs)
+        torch.cuda.current_stream().wait_stream(stream)
+        
+        graph = torch.cuda.CUDAGraph()
+        with torch.inference_mode(), torch.cuda.graph(graph):
+            self._static_logits = self.model(**self._static_inputs).logits
+        self._graph = graph
+    
+    def _replay_cuda_graph(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Copy a batch into the static buffers (padding with zeros) and replay the captured graph"""
+        batch_size, seq_len = inputs["input_ids"].shape
+        with self._graph_lock:
+            for name, static in self._static_inputs.items():
+                static.zero_()
+                static[:batch_size, :seq_len].copy_(inputs[name], non_blocking=True)
+            self._graph.replay()
+            return self._static_logits[:batch_size].clone()
+    
+    def _to_device(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        """Move tokenizer outputs to the model device"""
+        if self.device == "cuda":
+            return {k: v.pin_memory().to(self.device, non_blocking=True) for k, v in inputs.items()}
+        return {k: v.to(self.device) for k, v in inputs.items()}
+    
+    def _forward(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Run the model and return the logits tensor"""
+        if self.backend == "tensorrt":
+            # The engine is exported with int32 bindings; the tokenizer returns int64
+            feed = {name: inputs[name].to(torch.int32) for name in ("input_ids", "attention_mask")}
+            return self.model.infer(feed)["logits"]
+        if self.traced:
+            return self.model(inputs["input_ids"], inputs["attention_mask"])["logits"]
+        if self.compiled:
+            return self._forward_compiled(inputs)
+        if self._graph is not None and inputs["input_ids"].shape[0] <= MAX_BATCH_SIZE:
+            return self._replay_cuda_graph(inputs)
+        return self.model(**inputs).logits
+    
+    def _forward_compiled(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Run the compiled model on zero-padded (MAX_BATCH_SIZE, MAX_LENGTH) chunks so every batch
+        reuses the one graph captured at warmup instead of recompiling per batch size"""
+        batch_size = inputs["input_ids"].shape[0]
+        logits = []
+        for start in range(0, batch_size, MAX_BATCH_SIZE):
+            chunk = {name: tensor[start:start + MAX_BATCH_SIZE] for name, tensor in inputs.items()}
+            rows = chunk["input_ids"].shape[0]
+            padded = {
+                name: torch.nn.functional.pad(tensor, (0, 0, 0, MAX_BATCH_SIZE - rows))
+                for name, tensor in chunk.items()
+            }
+            # reduce-overhead replays a CUDA graph whose output buffer is reused: copy the real rows out
+            logits.append(self.model(**padded).logits[:rows].clone())
+        return torch.cat(logits)
+    
+    def _warmup(self):
+        """Run dummy forwards so the compiled (MAX_BATCH_SIZE x MAX_LENGTH) graph is captured before serving"""
+        inputs = self.tokenizer(
+            ["warmup"],
+            return_tensors="pt",
+            truncation=True,
+            max_length=MAX_LENGTH,
+            padding="max_length"
+        )
+        inputs = self._to_device(inputs)
+        with torch.inference_mode(), torch.autocast(
+            device_type=self.device, dtype=torch.float16, enabled=self.device == "cuda"
+        ):
+            for _ in range(2):
+                self._forward(inputs)
+    
     def preprocess_text(self, text: str) -> str:
         """Basic preprocessing - transformer handles most of it"""
         # Remove excessive whitespace
-        text = re.sub(r"\s+", " ", text).strip()
-        return text
+        return _WS_RE.sub(" ", text).strip()
     
     def predict(self, text: str) -> Dict:
         """
@@ -76,44 +368,86 @@ class MentalHealthPredictor:
         Returns:
             Dictionary with prediction and probabilities
         """
+        return self.predict_batch([text])[0]
+    
+    def predict_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        Predict mental health categories for several texts in one forward pass
+        
+        Args:
+            texts: User input texts
+            
+        Returns:
+            List of dictionaries (same order as texts) with prediction and probabilities
+        """
+        if not texts:
+            return []
+        
         # Preprocess
-        processed_text = self.preprocess_text(text)
+        processed_texts = [self.preprocess_text(text) for text in texts]
         
-        # Tokenize
+        # Serve repeated texts from the cache; only run the model on the misses
+        cached = {}
+        with self._cache_lock:
+            for processed_text in processed_texts:
+                if processed_text in self._cache:
+                    self._cache.move_to_end(processed_text)
+                    cached[processed_text] = self._cache[processed_text]
+        misses = list(dict.fromkeys(t for t in processed_texts if t not in cached))
+        if misses:
+            computed = dict(zip(misses, self._predict_uncached(misses)))
+            cached.update(computed)
+            if CACHE_SIZE > 0:
+                with self._cache_lock:
+                    self._cache.update(computed)
+                    while len(self._cache) > CACHE_SIZE:
+                        self._cache.popitem(last=False)
+        
+        # Return copies so callers cannot mutate the cached entries
+        return [
+            {**cached[t], "all_probabilities": dict(cached[t]["all_probabilities"])}
+            for t in processed_texts
+        ]
+    
+    def _predict_uncached(self, processed_texts: List[str]) -> List[Dict]:
+        """Run the model on already preprocessed texts"""
+        # Tokenize the whole batch at once (no padding for a single text, otherwise pad to the
+        # longest text; compiled models always see max-length inputs, with the batch padded to
+        # MAX_BATCH_SIZE in _forward_compiled, so the captured shape is reused)
+        if self.compiled:
+            padding = "max_length"
+        else:
+            padding = "longest" if len(processed_texts) > 1 else False
         inputs = self.tokenizer(
-            processed_text,
+            processed_texts,
             return_tensors="pt",
             truncation=True,
-            max_length=256,
-            padding=True
+            max_length=MAX_LENGTH,
+            padding=padding
         )
         
-        # Move inputs to device
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        # Move inputs to device (pinned host memory lets the copy overlap with compute)
+        inputs = self._to_device(inputs)
         
-        # Predict (no gradient calculation needed)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            logits = outputs.logits
-            probabilities = torch.softmax(logits, dim=-1)[0]
+        # Predict (inference mode skips autograd/view tracking; FP16 autocast on GPU)
+        with torch.inference_mode(), torch.autocast(
+            device_type=self.device, dtype=torch.float16, enabled=self.device == "cuda"
+        ):
+            logits = self._forward(inputs)
         
-        # Get prediction
-        predicted_class_id = torch.argmax(probabilities).item()
-        prediction = self.id2label[predicted_class_id]
-        confidence = probabilities[predicted_class_id].item()
+        # Single device -> host transfer for the whole batch
+        probabilities = torch.softmax(logits.float(), dim=-1).cpu().numpy()
+        # Class indices sorted by probability (highest first); the first one is the prediction
+        orders = np.argsort(-probabilities, axis=-1)
         
-        # Create probability dictionary
-        prob_dict = {
-            self.id2label[i]: float(probabilities[i].item())
-            for i in range(len(probabilities))
-        }
+        results = []
+        for processed_text, row, order in zip(processed_texts, probabilities, orders):
+            predicted_class_id = order[0]
+            results.append({
+                "prediction": self.labels[predicted_class_id],
+                "confidence": float(row[predicted_class_id]),
+                "all_probabilities": {self.labels[i]: float(row[i]) for i in order},
+                "preprocessed_text": processed_text
+            })
         
-        # Sort by probability (highest first)
-        prob_dict = dict(sorted(prob_dict.items(), key=lambda x: x[1], reverse=True))
-        
-        return {
-            "prediction": prediction,
-            "confidence": float(confidence),
-            "all_probabilities": prob_dict,
-            "preprocessed_text": processed_text
-        }
+        return results
@@ -6,23 +6,38 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import hashlib
 import json
-import re
-import string
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
-import pandas as pd
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import requests
+from urllib3.util.retry import Retry
 
 import kagglehub
-from datasets import load_dataset
+from datasketch import LeanMinHash, MinHash, MinHashLSH
+from datasets import concatenate_datasets, load_dataset
+from huggingface_hub import HfFileSystem
 
 WELLNESS_LABEL = "wellbeing"
 LABEL_ORDER = ["Anxiety", "SuicideWatch", "depression", "mentalhealth", WELLNESS_LABEL]
+# Fixed categories stored as UInt8 codes; written to Parquet as a dictionary-encoded column
+LABEL_DTYPE = pl.Enum(LABEL_ORDER)
 RANDOM_STATE = 42
 DEFAULT_OUTPUT = Path("python") / "data" / "combined_dataset.parquet"
 DEFAULT_STATS = Path("python") / "data" / "combined_dataset_stats.json"
+CACHE_DIR = Path("python") / "data" / ".cache"
+PUSHSHIFT_WINDOWS = 16
+PUSHSHIFT_LOOKBACK_SECONDS = 3 * 365 * 24 * 60 * 60
 GOEMOTIONS_POSITIVE = {
     "admiration",
     "amusement",
@@ -39,63 +54,158 @@ GOEMOTIONS_POSITIVE = {
     "relief",
     "surprise",
 }
+URL_PATTERN = r"http\S+"
+# string.punctuation as ASCII ranges: !-/  :-@  [-`  {-~
+PUNCT_PATTERN = r"[!-/:-@\[-`{-~]"
+# URLs, punctuation and whitespace all become a single space, so one alternation replaces the
+# three sequential passes (same output: a run of any of them collapses to one space)
+CLEAN_PATTERN = rf"(?:{URL_PATTERN}|{PUNCT_PATTERN}|\s)+"
+MINHASH_NUM_PERM = 128
+MINHASH_SHINGLE_SIZE = 5
 
 
-def log(message: str) -> None:
-    print(f"[data-pipeline] {message}")
-
-
-def preprocess_text(text: str) -> str:
-    text = str(text).lower()
-    text = re.sub(r"http\S+", " ", text)
-    text = re.sub(f"[{re.escape(string.punctuation)}]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-
-def combine_text_fields(
-    df: pd.DataFrame, primary: str = "selftext", secondary: str = "title"
-) -> pd.Series:
-    primary_series = df[primary].fillna("") if primary in df.columns else pd.Series("", index=df.index)
-    secondary_series = df[secondary].fillna("") if secondary in df.columns else pd.Series("", index=df.index)
-    return (primary_series.astype(str) + " " + secondary_series.astype(str)).str.strip()
+_LOG_LOCK = threading.Lock()
+# Set from the CLI in main(): --no-cache disables the loader cache, --refresh-cache rebuilds it
+CACHE_SETTINGS = {"enabled": True, "refresh": False}
 
 
-def sample_with_cap(df: pd.DataFrame, label_col: str, cap: Optional[int]) -> pd.DataFrame:
+def log(message: str) -> None:
+    # Loaders log from worker threads; the lock keeps lines from interleaving
+    with _LOG_LOCK:
+        print(f"[data-pipeline] {message}")
+
+
+class SourceUnavailable(Exception):
+    """A loader fell back to `fallback` (empty or partial data) after an error; never cached."""
+
+    def __init__(self, message: str, fallback: pl.LazyFrame) -> None:
+        super().__init__(message)
+        self.fallback = fallback
+
+
+def disk_cache(name: str) -> Callable[[Callable[..., pl.LazyFrame]], Callable[..., pl.LazyFrame]]:
+    def decorator(loader: Callable[..., pl.LazyFrame]) -> Callable[..., pl.LazyFrame]:
+        @functools.wraps(loader)
+        def wrapper(*args) -> pl.LazyFrame:
+            key = hashlib.blake2b(json.dumps(args).encode()).hexdigest()[:16]
+            path = CACHE_DIR / f"{name}_{key}.parquet"
+            if CACHE_SETTINGS["enabled"] and path.exists() and not CACHE_SETTINGS["refresh"]:
+                log(f"Using cached {name} from {path}")
+                return pl.scan_parquet(path)
+            try:
+                lf = loader(*args)
+            except SourceUnavailable as exc:
+                # Transient failure: use the fallback for this run only, so the next run retries the source
+                log(f"  → {exc}; not caching {name}")
+                return exc.fallback
+            if not CACHE_SETTINGS["enabled"]:
+                return lf
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file first so an interrupted run never leaves a truncated cache entry
+            tmp_path = path.with_suffix(".parquet.tmp")
+            lf.sink_parquet(tmp_path, compression="zstd")
+            tmp_path.replace(path)
+            return pl.scan_parquet(path)
+
+        return wrapper
+
+    return decorator
+
+
+def combine_text_fields(primary: str = "selftext", secondary: str = "title") -> pl.Expr:
+    return (
+        # Joined directly on the Arrow string buffers; a null side is skipped instead of filled with ""
+        pl.concat_str([pl.col(primary), pl.col(secondary)], separator=" ", ignore_nulls=True)
+        .str.strip_chars()
+        .alias("text")
+    )
+
+
+def sample_with_cap(lf: pl.LazyFrame, label_col: str, cap: Optional[int]) -> pl.LazyFrame:
     if cap is None:
-        return df
-    samples: List[pd.DataFrame] = []
-    for _, group in df.groupby(label_col):
-        take = min(len(group), cap)
-        samples.append(group.sample(take, random_state=RANDOM_STATE))
-    return pd.concat(samples, ignore_index=True) if samples else df
-
-
-def clean_and_dedup(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.dropna(subset=["text", "label"])
-    df["text"] = df["text"].astype(str)
-    df = df[~df["text"].str.strip().eq("")]
-    df["text"] = df["text"].replace({"[removed]": "", "[deleted]": ""}, regex=False)
-    df["text"] = df["text"].apply(preprocess_text)
-    df = df[df["text"].str.len() >= 30]
-    df = df.drop_duplicates(subset="text")
-    return df
-
-
-def load_original_labelled() -> pd.DataFrame:
+        return lf
+    # Random rank within each label, computed in one native pass; keep the first `cap` of every label
+    return lf.filter(pl.int_range(pl.len()).shuffle(seed=RANDOM_STATE).over(label_col) < cap)
+
+
+def empty_frame() -> pl.LazyFrame:
+    return pl.LazyFrame(schema={"text": pl.String, "label": pl.String})
+
+
+def scan_csv(path: Path) -> pl.LazyFrame:
+    # Read every column as text; only the columns selected downstream are parsed (projection pushdown)
+    return pl.scan_csv(path, infer_schema=False)
+
+
+def clean_and_dedup(lf: pl.LazyFrame) -> pl.LazyFrame:
+    # Lowercase, strip URLs/punctuation and collapse whitespace as native, multithreaded string kernels
+    return (
+        lf.drop_nulls(["text", "label"])
+        .filter(pl.col("text").str.strip_chars() != "")
+        .with_columns(
+            pl.col("text")
+            .str.replace_all("[removed]", "", literal=True)
+            .str.replace_all("[deleted]", "", literal=True)
+            .str.to_lowercase()
+            .str.replace_all(CLEAN_PATTERN, " ")
+            .str.strip_chars()
+        )
+        .filter(pl.col("text").str.len_chars() >= 30)
+        .unique(subset="text", keep="first", maintain_order=True)
+    )
+
+
+def minhash_signature(text: str) -> LeanMinHash:
+    words = text.split()
+    shingles = {
+        " ".join(words[i : i + MINHASH_SHINGLE_SIZE])
+        for i in range(max(1, len(words) - MINHASH_SHINGLE_SIZE + 1))
+    }
+    signature = MinHash(num_perm=MINHASH_NUM_PERM)
+    signature.update_batch(shingle.encode("utf8") for shingle in shingles)
+    # Lean: hash values + seed only, so it pickles small and needs no permutation arrays to rebuild
+    return LeanMinHash(signature)
+
+
+def drop_near_duplicates(df: pl.DataFrame, threshold: float) -> pl.DataFrame:
+    # MinHash over word 5-gram shingles; a post is dropped when it is a verified near-duplicate of an
+    # earlier kept post (templated posts that differ by a few words)
+    texts = df["text"].to_list()
+    # spawn rather than fork: Polars' thread pool and the loader threads are already running, and
+    # forking a multithreaded process can deadlock the child
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as executor:
+        signatures = list(executor.map(minhash_signature, texts, chunksize=1000))
+    lsh = MinHashLSH(threshold=threshold, num_perm=MINHASH_NUM_PERM)
+    kept: Dict[int, LeanMinHash] = {}
+    keep = np.ones(len(texts), dtype=bool)
+    for idx, signature in enumerate(signatures):
+        # LSH only proposes candidates (false positives included), so confirm each with the estimated
+        # Jaccard. Only kept posts are indexed: a post is dropped solely for directly matching an earlier
+        # kept post, so dissimilar posts can't be chained together through intermediate ones
+        if any(kept[match].jaccard(signature) >= threshold for match in lsh.query(signature)):
+            keep[idx] = False
+        else:
+            lsh.insert(idx, signature)
+            kept[idx] = signature
+    deduped = df.filter(pl.Series(keep))
+    log(f"Near-duplicate removal dropped {len(df) - len(deduped)} rows (threshold {threshold})")
+    return deduped
+
+
+@disk_cache("original_labelled")
+def load_original_labelled() -> pl.LazyFrame:
     log("Loading original labelled Kaggle splits…")
     base = Path(kagglehub.dataset_download("entenam/reddit-mental-health-dataset"))
     csv_names = ["LD DA 1.csv", "LD EL1.csv", "LD PF1.csv", "LD TS 1.csv"]
-    frames: List[pd.DataFrame] = []
+    frames: List[pl.LazyFrame] = []
     for name in csv_names:
         csv_path = base / "Original Reddit Data" / "Labelled Data" / name
-        df = pd.read_csv(csv_path, usecols=["selftext", "title", "subreddit"])
-        df["text"] = combine_text_fields(df)
-        frames.append(df[["text", "subreddit"]].rename(columns={"subreddit": "label"}))
-    return pd.concat(frames, ignore_index=True)
+        frames.append(scan_csv(csv_path).select(combine_text_fields(), pl.col("subreddit").alias("label")))
+    return pl.concat(frames)
 
 
-def load_kamaruladha(max_per_label: int) -> pd.DataFrame:
+@disk_cache("kamaruladha")
+def load_kamaruladha(max_per_label: int) -> pl.LazyFrame:
     log("Loading kamaruladha mental disorder dataset…")
     dataset_path = Path(kagglehub.dataset_download("kamaruladha/mental-disorders-identification-reddit-nlp"))
     csv_path = dataset_path / "mental_disorders_reddit.csv"
@@ -107,17 +217,42 @@ def load_kamaruladha(max_per_label: int) -> pd.DataFrame:
         "bipolar": "mentalhealth",
         "schizophrenia": "mentalhealth",
     }
-    df = pd.read_csv(csv_path, usecols=["title", "selftext", "subreddit"])
-    df = df[df["subreddit"].isin(label_map)]
-    df["label"] = df["subreddit"].map(label_map)
-    df["text"] = combine_text_fields(df)
-    df = df[["text", "label"]]
-    return sample_with_cap(df, "label", max_per_label)
-
-
-def load_solomonk(max_rows_per_file: int) -> pd.DataFrame:
+    lf = (
+        scan_csv(csv_path)
+        .filter(pl.col("subreddit").is_in(list(label_map)))
+        .select(combine_text_fields(), pl.col("subreddit").replace_strict(label_map).alias("label"))
+    )
+    return sample_with_cap(lf, "label", max_per_label)
+
+
+def read_csv_head(fs: HfFileSystem, path: str, columns: List[str], max_rows: int) -> pa.Table:
+    # Stream record batches with pyarrow's C++ CSV reader and stop downloading once enough rows arrived
+    with fs.open(path, "rb") as handle:
+        reader = pa_csv.open_csv(
+            handle,
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            # Streaming reads infer types from the first block only; an all-empty or all-numeric first
+            # block would type body/title as null/int and fail on a later block, so pin them to strings
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns,
+                column_types={column: pa.string() for column in columns},
+            ),
+        )
+        batches: List[pa.RecordBatch] = []
+        rows = 0
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows >= max_rows:
+                break
+        return pa.Table.from_batches(batches, schema=reader.schema).slice(0, max_rows)
+
+
+@disk_cache("solomonk")
+def load_solomonk(max_rows_per_file: int) -> pl.LazyFrame:
     log("Loading solomonk mental-health subreddit samples from HuggingFace…")
-    base_url = "https://huggingface.co/datasets/solomonk/reddit_mental_health_posts/resolve/main/{}"
+    base_path = "datasets/solomonk/reddit_mental_health_posts/{}"
+    fs = HfFileSystem()
     file_configs = {
         "depression.csv": ("depression", max_rows_per_file),
         "adhd.csv": ("mentalhealth", max_rows_per_file // 2),
@@ -125,159 +260,170 @@ def load_solomonk(max_rows_per_file: int) -> pd.DataFrame:
         "ocd.csv": ("mentalhealth", max_rows_per_file // 2),
         "ptsd.csv": ("mentalhealth", max_rows_per_file // 2),
     }
-    frames: List[pd.DataFrame] = []
-    for filename, (label, limit) in file_configs.items():
-        if limit <= 0:
-            continue
-        url = base_url.format(filename)
+
+    def fetch(filename: str, label: str, limit: int) -> pl.LazyFrame:
         log(f"  → Fetching {filename} (limit {limit})")
-        chunk = pd.read_csv(url, usecols=["body", "title"], nrows=limit * 2 or None)
-        chunk["text"] = combine_text_fields(chunk, primary="body", secondary="title")
-        chunk["label"] = label
-        chunk = chunk[["text", "label"]]
-        if len(chunk) > limit:
-            chunk = chunk.sample(limit, random_state=RANDOM_STATE)
-        frames.append(chunk)
-    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["text", "label"])
+        table = read_csv_head(fs, base_path.format(filename), ["body", "title"], limit * 2)
+        chunk = pl.from_arrow(table).lazy().select(
+            combine_text_fields(primary="body", secondary="title"), pl.lit(label).alias("label")
+        )
+        return sample_with_cap(chunk, "label", limit)
+
+    jobs = [(filename, label, limit) for filename, (label, limit) in file_configs.items() if limit > 0]
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as executor:
+        frames = list(executor.map(lambda job: fetch(*job), jobs))
+    return pl.concat(frames) if frames else empty_frame()
 
 
-def load_goemotions(max_rows: int) -> pd.DataFrame:
+@disk_cache("goemotions")
+def load_goemotions(max_rows: int) -> pl.LazyFrame:
     log("Loading GoEmotions positive samples…")
     dataset = load_dataset("go_emotions")
     label_names = dataset["train"].features["labels"].feature.names
-    splits = [dataset["train"], dataset["validation"], dataset["test"]]
-    df = pd.concat((split.to_pandas()[["text", "labels"]] for split in splits), ignore_index=True)
-
-    def has_positive(label_ids: List[int]) -> bool:
-        return any(label_names[idx] in GOEMOTIONS_POSITIVE for idx in label_ids)
-
-    df = df[df["labels"].apply(has_positive)].copy()
-    df["label"] = WELLNESS_LABEL
-    df = df[["text", "label"]]
-    if max_rows and len(df) > max_rows:
-        df = df.sample(max_rows, random_state=RANDOM_STATE)
-    log(f"  → GoEmotions positive samples: {len(df)}")
-    return df
-
-
-def load_twitter_positive(max_rows: int) -> pd.DataFrame:
+    positive_ids = [idx for idx, name in enumerate(label_names) if name in GOEMOTIONS_POSITIVE]
+    splits = concatenate_datasets([dataset["train"], dataset["validation"], dataset["test"]])
+    # Match the label lists against the positive ids natively in Polars (no per-row Python callback)
+    table = splits.select_columns(["text", "labels"]).with_format("arrow")[:]
+    keep = (
+        pl.from_arrow(table)
+        .filter(pl.col("labels").list.eval(pl.element().is_in(positive_ids)).list.any())
+        .select("text", pl.lit(WELLNESS_LABEL).alias("label"))
+    )
+    log(f"  → GoEmotions positive samples: {min(keep.height, max_rows or keep.height)}")
+    return sample_with_cap(keep.lazy(), "label", max_rows or None)
+
+
+def load_positive_split_rows(dataset, positive_labels: List[int]) -> Optional[pl.DataFrame]:
+    # Combine all splits and keep only positive rows; the Arrow table goes to Polars as-is and the
+    # label match runs natively rather than as a per-row Python callback
+    splits = [dataset[split_name] for split_name in ["train", "validation", "test"] if split_name in dataset]
+    if not splits:
+        return None
+    table = concatenate_datasets(splits).select_columns(["text", "label"]).with_format("arrow")[:]
+    return (
+        pl.from_arrow(table)
+        .filter(pl.col("label").is_in(positive_labels))
+        .select("text", pl.lit(WELLNESS_LABEL).alias("label"))
+    )
+
+
+@disk_cache("twitter_positive")
+def load_twitter_positive(max_rows: int) -> pl.LazyFrame:
     """Load positive sentiment from tweet_eval sentiment dataset"""
     log("Loading Twitter positive sentiment samples…")
     try:
         dataset = load_dataset("tweet_eval", "sentiment")
-        # Combine all splits
-        frames = []
-        for split_name in ["train", "validation", "test"]:
-            if split_name in dataset:
-                split_df = dataset[split_name].to_pandas()
-                # sentiment: 0=negative, 1=neutral, 2=positive
-                split_df = split_df[split_df["label"] == 2].copy()
-                frames.append(split_df)
+        # sentiment: 0=negative, 1=neutral, 2=positive
+        keep = load_positive_split_rows(dataset, [2])
         
-        if not frames:
+        if keep is None or keep.height == 0:
             log("  → No positive tweets found")
-            return pd.DataFrame(columns=["text", "label"])
-            
-        df = pd.concat(frames, ignore_index=True)
-        df["label"] = WELLNESS_LABEL
-        df = df[["text", "label"]]
+            return empty_frame()
         
-        if max_rows and len(df) > max_rows:
-            df = df.sample(max_rows, random_state=RANDOM_STATE)
-        log(f"  → Twitter positive samples: {len(df)}")
-        return df
+        log(f"  → Twitter positive samples: {min(keep.height, max_rows or keep.height)}")
+        return sample_with_cap(keep.lazy(), "label", max_rows or None)
     except Exception as e:
-        log(f"  → Twitter dataset failed: {e}, skipping")
-        return pd.DataFrame(columns=["text", "label"])
+        raise SourceUnavailable(f"Twitter dataset failed: {e}, skipping", fallback=empty_frame()) from e
 
 
-def load_positive_reddit(max_rows: int) -> pd.DataFrame:
+@disk_cache("positive_reddit")
+def load_positive_reddit(max_rows: int) -> pl.LazyFrame:
     """Load positive samples from emotion dataset"""
     log("Loading positive emotion samples (joy, love)…")
     try:
         dataset = load_dataset("emotion")
-        # Combine all splits
-        frames = []
-        for split_name in ["train", "validation", "test"]:
-            if split_name in dataset:
-                split_df = dataset[split_name].to_pandas()
-                # emotion labels: sadness(0), joy(1), love(2), anger(3), fear(4), surprise(5)
-                # Filter for joy(1) and love(2)
-                split_df = split_df[split_df["label"].isin([1, 2])].copy()
-                frames.append(split_df)
+        # emotion labels: sadness(0), joy(1), love(2), anger(3), fear(4), surprise(5)
+        # Filter for joy(1) and love(2)
+        keep = load_positive_split_rows(dataset, [1, 2])
         
-        if not frames:
+        if keep is None or keep.height == 0:
             log("  → No positive emotions found")
-            return pd.DataFrame(columns=["text", "label"])
-            
-        df = pd.concat(frames, ignore_index=True)
-        df["label"] = WELLNESS_LABEL
-        df = df[["text", "label"]]
+            return empty_frame()
         
-        if max_rows and len(df) > max_rows:
-            df = df.sample(max_rows, random_state=RANDOM_STATE)
-        log(f"  → Positive emotion samples (joy/love): {len(df)}")
-        return df
+        log(f"  → Positive emotion samples (joy/love): {min(keep.height, max_rows or keep.height)}")
+        return sample_with_cap(keep.lazy(), "label", max_rows or None)
     except Exception as e:
-        log(f"  → Emotion dataset failed: {e}, skipping")
-        return pd.DataFrame(columns=["text", "label"])
+        raise SourceUnavailable(f"Emotion dataset failed: {e}, skipping", fallback=empty_frame()) from e
 
 
-def load_suicide_watch(max_rows: int) -> pd.DataFrame:
+@disk_cache("suicide_watch")
+def load_suicide_watch(max_rows: int) -> pl.LazyFrame:
     log("Loading SuicideWatch positives…")
     dataset_path = Path(kagglehub.dataset_download("nikhileswarkomati/suicide-watch"))
     csv_path = dataset_path / "Suicide_Detection.csv"
-    df = pd.read_csv(csv_path, usecols=["text", "class"])
-    df = df[df["class"] == "suicide"]
-    if max_rows and len(df) > max_rows:
-        df = df.sample(max_rows, random_state=RANDOM_STATE)
-    df["label"] = "SuicideWatch"
-    return df[["text", "label"]]
+    lf = (
+        scan_csv(csv_path)
+        .filter(pl.col("class") == "suicide")
+        .select(pl.col("text"), pl.lit("SuicideWatch").alias("label"))
+    )
+    return sample_with_cap(lf, "label", max_rows or None)
 
 
-def fetch_lonely_from_pushshift(max_posts: int, batch_size: int, enabled: bool) -> pd.DataFrame:
+@disk_cache("pushshift_lonely")
+def fetch_lonely_from_pushshift(max_posts: int, batch_size: int, enabled: bool) -> pl.LazyFrame:
     if not enabled:
         log("Skipping Pushshift lonely data fetch (disabled).")
-        return pd.DataFrame(columns=["text", "label"])
+        return empty_frame()
 
     log("Fetching r/lonely posts from Pushshift…")
     url = "https://api.pushshift.io/reddit/search/submission/"
     headers = {"User-Agent": "reddit-mood-scan/1.0 data-ingestion"}
-    posts: List[Dict[str, str]] = []
-    before: Optional[int] = None
+    # Split the time axis into disjoint windows and page through them concurrently
+    # so request round-trips overlap instead of running back-to-back
+    end = int(time.time())
+    start = end - PUSHSHIFT_LOOKBACK_SECONDS
+    step = (end - start) // PUSHSHIFT_WINDOWS
+    windows = [(start + i * step, start + (i + 1) * step) for i in range(PUSHSHIFT_WINDOWS)]
+    per_window = -(-max_posts // PUSHSHIFT_WINDOWS)
     session = requests.Session()
-    while len(posts) < max_posts:
-        params = {
-            "subreddit": "lonely",
-            "size": batch_size,
-            "fields": "selftext,title,created_utc",
-        }
-        if before is not None:
-            params["before"] = before
-        try:
-            resp = session.get(url, params=params, headers=headers, timeout=30)
-            resp.raise_for_status()
-        except requests.RequestException as exc:
-            log(f"  → request failed ({exc}); stopping fetch.")
-            break
-        data = resp.json().get("data", [])
-        if not data:
-            break
-        posts.extend(data)
-        before = data[-1]["created_utc"]
-        log(f"  → collected {len(posts)} posts")
+    # Back off and retry rate-limited / transient server errors (honours Retry-After) before giving up on a window
+    retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=PUSHSHIFT_WINDOWS, max_retries=retries)
+    session.mount("https://", adapter)
+
+    def fetch_window(after: int, before: int) -> Tuple[List[Dict[str, str]], bool]:
+        # Returns the posts and whether the window ended on a request error (i.e. may be incomplete)
+        window_posts: List[Dict[str, str]] = []
+        while len(window_posts) < per_window:
+            params = {
+                "subreddit": "lonely",
+                "after": after,
+                "before": before,
+                "size": batch_size,
+                "fields": "id,selftext,title,created_utc",
+            }
+            try:
+                resp = session.get(url, params=params, headers=headers, timeout=30)
+                resp.raise_for_status()
+            except requests.RequestException as exc:
+                log(f"  → request failed ({exc}); stopping window fetch.")
+                return window_posts, True
+            data = resp.json().get("data", [])
+            if not data:
+                break
+            window_posts.extend(data)
+            before = data[-1]["created_utc"]
+        return window_posts, False
+
+    with ThreadPoolExecutor(max_workers=PUSHSHIFT_WINDOWS) as executor:
+        results = list(executor.map(lambda window: fetch_window(*window), windows))
+    posts = [post for window_posts, _ in results for post in window_posts]
+    failed_windows = sum(failed for _, failed in results)
     log(f"Collected {len(posts)} lonely posts total.")
-    if not posts:
-        return pd.DataFrame(columns=["text", "label"])
-    df = pd.DataFrame(posts)
-    if "selftext" not in df:
-        df["selftext"] = ""
-    if "title" not in df:
-        df["title"] = ""
-    df["text"] = combine_text_fields(df)
-    # Map lonely to depression since loneliness is often associated with depressive symptoms
-    df["label"] = "depression"
-    return df[["text", "label"]]
+    if posts:
+        df = pl.DataFrame(posts)
+        for column in ["id", "selftext", "title", "created_utc"]:
+            if column not in df.columns:
+                df = df.with_columns(pl.lit(None, dtype=pl.String).alias(column))
+        # Posts on a window boundary can come back twice
+        df = df.unique(subset="id", maintain_order=True).head(max_posts)
+        # Map lonely to depression since loneliness is often associated with depressive symptoms
+        result = df.lazy().select(combine_text_fields(), pl.lit("depression").alias("label"))
+    else:
+        result = empty_frame()
+    if failed_windows:
+        raise SourceUnavailable(f"{failed_windows} Pushshift window(s) ended on a request error", fallback=result)
+    return result
 
 
 def parse_args() -> argparse.Namespace:
@@ -293,26 +439,38 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--lonely-max-posts", type=int, default=12000, help="Maximum posts to fetch from Pushshift r/lonely.")
     parser.add_argument("--lonely-batch-size", type=int, default=250, help="Pushshift batch size.")
     parser.add_argument("--skip-pushshift", action="store_true", help="Skip Pushshift lonely collection.")
+    parser.add_argument("--near-dup-threshold", type=float, default=0.0, help="Opt-in MinHash-LSH near-duplicate removal: drop posts whose estimated Jaccard to an earlier post is >= this (e.g. 0.8). 0 disables.")
+    parser.add_argument("--no-cache", action="store_true", help=f"Always run every loader; do not read or write {CACHE_DIR}.")
+    parser.add_argument("--refresh-cache", action="store_true", help="Re-run every loader and overwrite its cached Parquet output.")
     parser.add_argument("--sample-per-label", type=int, default=None, help="Optional cap for the final combined dataset per label.")
     return parser.parse_args()
 
 
-def save_dataset(df: pd.DataFrame, path: Path) -> None:
+def save_dataset(df: pl.DataFrame, path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     if path.suffix.lower() == ".csv":
-        df.to_csv(path, index=False)
+        df.write_csv(path)
     else:
-        df.to_parquet(path, index=False)
-    log(f"Saved dataset with {len(df)} rows to {path}")
-
-
-def save_stats(df: pd.DataFrame, path: Path) -> None:
+        # Zstd is smaller than the default Snappy; row-group statistics enable predicate pushdown on read
+        df.write_parquet(
+            path,
+            compression="zstd",
+            compression_level=3,
+            row_group_size=256_000,
+            statistics=True,
+        )
+    log(f"Saved dataset with {df.height} rows to {path}")
+
+
+def save_stats(df: pl.DataFrame, path: Path, near_dup_threshold: float, near_dup_dropped: int) -> None:
     if not path:
         return
     path.parent.mkdir(parents=True, exist_ok=True)
     stats = {
-        "total_rows": int(len(df)),
-        "label_counts": df["label"].value_counts().to_dict(),
+        "total_rows": df.height,
+        "label_counts": dict(df["label"].value_counts(sort=True).iter_rows()),
+        "near_dup_threshold": near_dup_threshold,
+        "near_duplicates_dropped": near_dup_dropped,
     }
     path.write_text(json.dumps(stats, indent=2))
     log(f"Saved dataset stats to {path}")
@@ -320,27 +478,47 @@ def save_stats(df: pd.DataFrame, path: Path) -> None:
 
 def main() -> None:
     args = parse_args()
-    frames = [
-        load_original_labelled(),
-        load_kamaruladha(args.max_kamaruladha),
-        load_solomonk(args.max_solomonk),
-        load_goemotions(args.max_goemotions),
-        load_twitter_positive(args.max_twitter_positive),
-        load_positive_reddit(args.max_reddit_positive),
-        load_suicide_watch(args.max_suicidewatch),
-        fetch_lonely_from_pushshift(args.lonely_max_posts, args.lonely_batch_size, not args.skip_pushshift),
-    ]
-    raw_dataset = pd.concat(frames, ignore_index=True)
-    raw_dataset = raw_dataset[raw_dataset["label"].isin(LABEL_ORDER)]
-    dataset = clean_and_dedup(raw_dataset)
+    CACHE_SETTINGS.update(enabled=not args.no_cache, refresh=args.refresh_cache)
+    # Every loader is dominated by download / HTTP time, so run them concurrently
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [
+            executor.submit(load_original_labelled),
+            executor.submit(load_kamaruladha, args.max_kamaruladha),
+            executor.submit(load_solomonk, args.max_solomonk),
+            executor.submit(load_goemotions, args.max_goemotions),
+            executor.submit(load_twitter_positive, args.max_twitter_positive),
+            executor.submit(load_positive_reddit, args.max_reddit_positive),
+            executor.submit(load_suicide_watch, args.max_suicidewatch),
+        ]
+        if not args.skip_pushshift:
+            futures.append(
+                executor.submit(fetch_lonely_from_pushshift, args.lonely_max_posts, args.lonely_batch_size, True)
+            )
+        frames = [future.result() for future in futures]
+    if args.skip_pushshift:
+        frames.append(fetch_lonely_from_pushshift(args.lonely_max_posts, args.lonely_batch_size, False))
+    # Loaders return lazy plans; CSV parsing, cleaning and exact dedup run in one streaming collect
+    # Labels become Enum codes, so dedup, the per-label window and value counts work on integers
+    raw_dataset = (
+        pl.concat(frames, how="diagonal_relaxed")
+        .filter(pl.col("label").is_in(LABEL_ORDER))
+        .with_columns(pl.col("label").cast(LABEL_DTYPE))
+    )
+    dataset = clean_and_dedup(raw_dataset).collect(engine="streaming")
+    near_dup_dropped = 0
+    if args.near_dup_threshold:
+        deduped = drop_near_duplicates(dataset, args.near_dup_threshold)
+        near_dup_dropped = dataset.height - deduped.height
+        dataset = deduped
     if args.sample_per_label:
-        dataset = sample_with_cap(dataset, "label", args.sample_per_label)
-    dataset = dataset.sample(frac=1, random_state=RANDOM_STATE).reset_index(drop=True)
+        dataset = sample_with_cap(dataset.lazy(), "label", args.sample_per_label).collect()
+    # The shuffled frame is written straight from Polars; no pandas copy
+    dataset = dataset.sample(fraction=1, shuffle=True, seed=RANDOM_STATE)
     log("Final label distribution:")
-    log(dataset["label"].value_counts().to_string())
+    log(str(dataset["label"].value_counts(sort=True)))
     save_dataset(dataset, args.output)
     if args.stats_output:
-        save_stats(dataset, args.stats_output)
+        save_stats(dataset, args.stats_output, args.near_dup_threshold, near_dup_dropped)
 
 
 if __name__ == "__main__":
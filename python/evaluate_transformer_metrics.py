@@ -30,8 +30,10 @@ matplotlib.use("Agg")  # headless plot rendering
 import matplotlib.pyplot as plt  # noqa: E402
 import numpy as np  # noqa: E402
 import pandas as pd  # noqa: E402
+import polars as pl  # noqa: E402
 import torch  # noqa: E402
 from sklearn.metrics import (  # noqa: E402
+    ConfusionMatrixDisplay,
     accuracy_score,
     classification_report,
     confusion_matrix,
@@ -39,9 +41,9 @@ from sklearn.metrics import (  # noqa: E402
     roc_auc_score,
     roc_curve,
 )
-from sklearn.model_selection import train_test_split  # noqa: E402
 from sklearn.preprocessing import label_binarize  # noqa: E402
-from torch.utils.data import DataLoader, Dataset  # noqa: E402
+from torch.utils.data import DataLoader, Dataset, Subset  # noqa: E402
+from splits import stratified_split  # noqa: E402
 from transformers import (  # noqa: E402
     AutoModelForSequenceClassification,
     AutoTokenizer,
@@ -59,27 +61,16 @@ def log(message: str) -> None:
 
 
 class TextDataset(Dataset):
-    def __init__(self, texts: List[str], labels: List[int], tokenizer, max_length: int):
-        self.texts = texts
+    def __init__(self, encodings: Dict[str, List[List[int]]], labels: List[int]):
+        self.encodings = encodings
         self.labels = labels
-        self.tokenizer = tokenizer
-        self.max_length = max_length
 
     def __len__(self) -> int:
-        return len(self.texts)
-
-    def __getitem__(self, idx: int) -> Dict[str, torch.Tensor]:
-        text = self.texts[idx]
-        label = self.labels[idx]
-        encoded = self.tokenizer(
-            text,
-            truncation=True,
-            padding="max_length",
-            max_length=self.max_length,
-            return_tensors="pt",
-        )
-        item = {k: v.squeeze(0) for k, v in encoded.items()}
-        item["labels"] = torch.tensor(label, dtype=torch.long)
+        return len(self.labels)
+
+    def __getitem__(self, idx: int) -> Dict[str, List[int]]:
+        item = {k: v[idx] for k, v in self.encodings.items()}
+        item["labels"] = self.labels[idx]
         return item
 
 
@@ -111,24 +102,60 @@ def load_dataframe(path: Path) -> pd.DataFrame:
         raise FileNotFoundError(f"Dataset not found: {path}")
     if path.suffix.lower() == ".csv":
         return pd.read_csv(path)
-    return pd.read_parquet(path)
+    # Label filter is pushed down into the Parquet scan (skips row groups via column statistics)
+    return pl.scan_parquet(path).filter(pl.col("label").is_in(LABEL_ORDER)).collect().to_pandas()
 
 
 def prepare_data(df: pd.DataFrame, test_size: float) -> Tuple[List[str], List[int], List[str]]:
     df = df[df["label"].isin(LABEL_ORDER)].copy()
-    label2id = {label: idx for idx, label in enumerate(LABEL_ORDER)}
-    df["label_id"] = df["label"].map(label2id)
-    _, test_df = train_test_split(
-        df,
-        test_size=test_size,
-        stratify=df["label_id"],
-        random_state=42,
-    )
+    # Category codes follow LABEL_ORDER, so they are the label ids directly
+    df["label_id"] = pd.Categorical(df["label"], categories=LABEL_ORDER).codes
+    # Same splitter and seed as train_gpu_transformer.py, so this is exactly the training holdout
+    _, test_idx = stratified_split(df["label_id"].to_numpy(), test_size)
+    test_df = df.iloc[test_idx]
     texts = test_df["text"].astype(str).tolist()
     labels = test_df["label_id"].tolist()
     return texts, labels, LABEL_ORDER
 
 
+def load_onnx_int8_model(model_dir: Path):
+    try:
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as e:
+        raise ImportError("--onnx-int8 requires optimum: pip install optimum[onnxruntime]") from e
+
+    # Same export location as the API's ONNX backend, so either side reuses the other's export
+    onnx_dir = model_dir / "onnx_int8"
+    if not (onnx_dir / "model_quantized.onnx").exists():
+        log(f"ส่งออกโมเดลเป็น ONNX (INT8) ที่ {onnx_dir}")
+        ort_model = ORTModelForSequenceClassification.from_pretrained(model_dir, export=True)
+        quantizer = ORTQuantizer.from_pretrained(ort_model)
+        quantizer.quantize(
+            save_dir=onnx_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+        )
+    return ORTModelForSequenceClassification.from_pretrained(onnx_dir, file_name="model_quantized.onnx")
+
+
+def compile_model(model, tokenizer, device: torch.device, max_length: int, batch_size: int):
+    # dynamic=True: length-sorted batches have many sequence lengths; avoid one recompile per shape
+    model = torch.compile(model, dynamic=True)
+
+    # Trigger compilation on a max-length dummy batch before the real loop
+    dummy = tokenizer(
+        ["warmup"] * batch_size,
+        padding="max_length",
+        truncation=True,
+        max_length=max_length,
+        return_tensors="pt",
+    ).to(device)
+    amp_dtype = torch.float16 if device.type == "cuda" else torch.bfloat16
+    with torch.inference_mode(), torch.autocast(device_type=device.type, dtype=amp_dtype):
+        model(**dummy)
+    return model
+
+
 def run_inference(
     texts: List[str],
     labels: List[int],
@@ -138,52 +165,37 @@ def run_inference(
     max_length: int,
     batch_size: int,
 ) -> Tuple[np.ndarray, np.ndarray]:
-    dataset = TextDataset(texts, labels, tokenizer, max_length)
-    collator = DataCollatorWithPadding(tokenizer=tokenizer)
-    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=False, collate_fn=collator)
-
-    all_logits: List[np.ndarray] = []
-    all_labels: List[int] = []
-
-    model.eval()
+    # Tokenize the split once with the batched fast tokenizer; the collator pads each batch
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    dataset = TextDataset(dict(encodings), labels)
+    # Batch in order of token length so each batch pads only to its own (similar) lengths
+    order = np.argsort([len(ids) for ids in encodings["input_ids"]], kind="stable")
+    collator = DataCollatorWithPadding(tokenizer=tokenizer, padding="longest", pad_to_multiple_of=8)
+    dataloader = DataLoader(Subset(dataset, order.tolist()), batch_size=batch_size, shuffle=False, collate_fn=collator)
+
+    all_probs: List[torch.Tensor] = []
+    amp_dtype = torch.float16 if device.type == "cuda" else torch.bfloat16
+
+    if isinstance(model, torch.nn.Module):
+        model.eval()
     for batch in dataloader:
-        batch = {k: v.to(device) for k, v in batch.items()}
-        with torch.no_grad():
+        batch = {k: v.to(device) for k, v in batch.items() if k != "labels"}
+        with torch.inference_mode(), torch.autocast(device_type=device.type, dtype=amp_dtype):
             outputs = model(**batch)
-            logits = outputs.logits.detach().cpu().numpy()
-        all_logits.append(logits)
-        all_labels.extend(batch["labels"].cpu().numpy())
+            # Softmax on the device; probabilities stay there until one host transfer after the loop
+            all_probs.append(torch.softmax(outputs.logits.float(), dim=-1))
 
-    logits_arr = np.concatenate(all_logits, axis=0)
-    labels_arr = np.array(all_labels)
-    return logits_arr, labels_arr
+    # Undo the length sort so rows line up with the input order again
+    probs_arr = torch.cat(all_probs).cpu().numpy()[np.argsort(order)]
+    labels_arr = np.array(labels)
+    return probs_arr, labels_arr
 
 
 def plot_confusion(cm: np.ndarray, labels: List[str], path: Path) -> None:
     fig, ax = plt.subplots(figsize=(6, 5))
-    im = ax.imshow(cm, interpolation="nearest", cmap=plt.cm.Blues)
-    ax.figure.colorbar(im, ax=ax)
-    ax.set(
-        xticks=np.arange(cm.shape[1]),
-        yticks=np.arange(cm.shape[0]),
-        xticklabels=labels,
-        yticklabels=labels,
-        ylabel="True label",
-        xlabel="Predicted label",
-        title="Confusion Matrix",
-    )
-    plt.setp(ax.get_xticklabels(), rotation=45, ha="right", rotation_mode="anchor")
-    thresh = cm.max() / 2.0
-    for i in range(cm.shape[0]):
-        for j in range(cm.shape[1]):
-            ax.text(
-                j,
-                i,
-                format(cm[i, j], "d"),
-                ha="center",
-                va="center",
-                color="white" if cm[i, j] > thresh else "black",
-            )
+    disp = ConfusionMatrixDisplay(cm, display_labels=labels)
+    disp.plot(ax=ax, cmap=plt.cm.Blues, xticks_rotation=45, values_format="d")
+    ax.set_title("Confusion Matrix")
     fig.tight_layout()
     path.parent.mkdir(parents=True, exist_ok=True)
     fig.savefig(path, dpi=200)
@@ -253,8 +265,12 @@ def main() -> None:
     parser.add_argument("--test-size", type=float, default=None, help="Holdout fraction for evaluation. If omitted, a menu will appear.")
     parser.add_argument("--max-length", type=int, default=128, help="Tokenizer max length (should match training).")
     parser.add_argument("--batch-size", type=int, default=32, help="Evaluation batch size.")
+    parser.add_argument("--onnx-int8", action="store_true", help="Evaluate an INT8 ONNX Runtime export on CPU instead of the PyTorch model.")
+    parser.add_argument("--compile", action="store_true", help="Compile the PyTorch model with torch.compile (not combinable with --onnx-int8).")
     parser.add_argument("--skip-plots", action="store_true", help="Only print metrics; do not save plots.")
     args = parser.parse_args()
+    if args.compile and args.onnx_int8:
+        parser.error("--compile applies to the PyTorch model and cannot be combined with --onnx-int8")
 
     test_size = args.test_size if args.test_size else prompt_test_size()
     log(f"ใช้ test_size={test_size:.2f}")
@@ -264,13 +280,19 @@ def main() -> None:
     log(f"ตัวอย่างสำหรับทดสอบ: {len(texts)}")
 
     tokenizer = AutoTokenizer.from_pretrained(args.model_dir)
-    model = AutoModelForSequenceClassification.from_pretrained(args.model_dir)
-
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model.to(device)
+    if args.onnx_int8:
+        model = load_onnx_int8_model(args.model_dir)
+        device = torch.device("cpu")
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(args.model_dir)
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model.to(device)
+        if args.compile:
+            model.eval()
+            model = compile_model(model, tokenizer, device, args.max_length, args.batch_size)
     log(f"ใช้ device: {device}")
 
-    logits, y_true = run_inference(
+    probs, y_true = run_inference(
         texts=texts,
         labels=labels,
         tokenizer=tokenizer,
@@ -279,7 +301,6 @@ def main() -> None:
         max_length=args.max_length,
         batch_size=args.batch_size,
     )
-    probs = torch.softmax(torch.tensor(logits), dim=1).numpy()
     y_pred = probs.argmax(axis=1)
 
     report_dict = classification_report(
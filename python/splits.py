@@ -0,0 +1,37 @@
+"""
+Stratified train/test split shared by the training and evaluation scripts.
+
+Both scripts must hold out exactly the same rows, otherwise evaluation scores
+examples the model was trained on.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+RANDOM_STATE = 42
+
+
+def stratified_split(
+    label_ids: np.ndarray, test_size: float, seed: int = RANDOM_STATE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Shuffle each label's row indices and hold out `test_size` of them.
+
+    The held-out count per label is rounded up (as sklearn's train_test_split does
+    for the test side), so even a tiny label keeps at least one evaluation row.
+    Labels are visited in sorted id order with one seeded generator, so two callers
+    get the same split as long as their rows are in the same order and their ids
+    follow the same label order (both scripts number labels along LABEL_ORDER).
+    """
+    rng = np.random.default_rng(seed)
+    train_idx, test_idx = [], []
+    for label_id in np.unique(label_ids):
+        idx = np.flatnonzero(label_ids == label_id)
+        rng.shuffle(idx)
+        k = math.ceil(len(idx) * test_size)
+        test_idx.append(idx[:k])
+        train_idx.append(idx[k:])
+    return np.concatenate(train_idx), np.concatenate(test_idx)
@@ -0,0 +1,27 @@
+import random
+import string
+
+import pytest
+
+pl = pytest.importorskip("polars")
+data_pipeline = pytest.importorskip("data_pipeline")
+
+ALPHABET = "ab h t p : / . ! ? - _ \t \n é".split(" ") + [" ", "http", "https://x.y/z", "[x]"]
+
+
+def three_pass_clean(texts):
+    return (
+        pl.Series(texts)
+        .str.replace_all(data_pipeline.URL_PATTERN, " ")
+        .str.replace_all(data_pipeline.PUNCT_PATTERN, " ")
+        .str.replace_all(r"\s+", " ")
+        .to_list()
+    )
+
+
+def test_clean_pattern_matches_three_sequential_passes():
+    rng = random.Random(0)
+    texts = ["".join(rng.choices(ALPHABET, k=rng.randint(0, 40))) for _ in range(2000)]
+    texts += [string.punctuation, "see http://a.b/c?d=1, then https://e.f!", "x" + string.whitespace + "y"]
+    combined = pl.Series(texts).str.replace_all(data_pipeline.CLEAN_PATTERN, " ").to_list()
+    assert combined == three_pass_clean(texts)
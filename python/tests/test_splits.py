@@ -0,0 +1,34 @@
+import math
+
+import numpy as np
+import pytest
+
+from splits import stratified_split
+
+
+@pytest.fixture
+def label_ids():
+    rng = np.random.default_rng(0)
+    # Unbalanced labels, including one with a single row
+    return rng.permutation(np.repeat(np.arange(5), [500, 120, 37, 9, 1]))
+
+
+@pytest.mark.parametrize("test_size", [0.1, 0.2, 0.25])
+def test_test_count_per_label_is_rounded_up(label_ids, test_size):
+    _, test_idx = stratified_split(label_ids, test_size)
+    for label_id, count in zip(*np.unique(label_ids, return_counts=True)):
+        assert (label_ids[test_idx] == label_id).sum() == math.ceil(count * test_size)
+
+
+def test_split_is_a_partition(label_ids):
+    train_idx, test_idx = stratified_split(label_ids, 0.2)
+    assert np.intersect1d(train_idx, test_idx).size == 0
+    assert np.array_equal(np.sort(np.concatenate([train_idx, test_idx])), np.arange(len(label_ids)))
+
+
+def test_split_is_deterministic_under_the_seed(label_ids):
+    first = stratified_split(label_ids, 0.2)
+    second = stratified_split(label_ids, 0.2)
+    other_seed = stratified_split(label_ids, 0.2, seed=7)
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert not np.array_equal(first[1], other_seed[1])
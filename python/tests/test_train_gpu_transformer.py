@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("torch")
+train = pytest.importorskip("train_gpu_transformer")
+
+GB = 1024**3
+
+
+@pytest.mark.parametrize(
+    "model_name, vram_gb, expected",
+    [
+        ("distilbert-base-uncased", 12, (32, 64, 1, 256)),
+        ("distilbert-base-uncased", 8, (16, 32, 2, 256)),
+        ("bert-base-uncased", 4, (4, 8, 4, 128)),
+        ("roberta-large", 12, (8, 16, 2, 256)),
+        ("some/unknown-model", 6, (4, 8, 4, 128)),
+    ],
+)
+def test_auto_scale_batch_size_uses_vram_table(monkeypatch, model_name, vram_gb, expected):
+    monkeypatch.setattr(train.torch.cuda, "is_available", lambda: True)
+    monkeypatch.setattr(train, "_gpu_info", lambda: ("Test GPU", vram_gb * GB))
+    assert train.auto_scale_batch_size(model_name) == expected
+
+
+def test_auto_scale_batch_size_on_cpu(monkeypatch):
+    monkeypatch.setattr(train.torch.cuda, "is_available", lambda: False)
+    assert train.auto_scale_batch_size("distilbert-base-uncased") == (2, 4, 8, 128)
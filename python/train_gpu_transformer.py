@@ -9,8 +9,12 @@ Run `python python/data_pipeline.py` first to produce the dataset, then execute:
 from __future__ import annotations
 
 import argparse
+import functools
+import hashlib
 import json
 import os
+import shutil
+import sys
 from pathlib import Path
 from typing import Dict, Tuple
 
@@ -20,10 +24,10 @@ os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 import numpy as np
 import pandas as pd
 import torch
-from datasets import Dataset
+from datasets import Dataset, load_from_disk
 from sklearn.metrics import accuracy_score, classification_report, f1_score
-from sklearn.model_selection import train_test_split
 from sklearn.utils.class_weight import compute_class_weight
+from splits import stratified_split
 from transformers import (
     AutoModelForSequenceClassification,
     AutoTokenizer,
@@ -31,18 +35,29 @@ from transformers import (
     Trainer,
     TrainingArguments,
 )
-from torch import nn
+import torch.nn.functional as F
 
 # Removed "lonely" due to insufficient data (only 46 samples from failed Pushshift API)
 LABEL_ORDER = ["Anxiety", "SuicideWatch", "depression", "mentalhealth", "wellbeing"]
 DEFAULT_DATA_PATH = Path("python") / "data" / "combined_dataset.parquet"
 DEFAULT_MODEL_DIR = Path("model") / "transformer_bert_base"
 DEFAULT_MODEL_NAME = "bert-base-uncased"
+TOKENIZED_CACHE_DIR = Path("python") / "data" / ".cache"
 RANDOM_STATE = 42
+# Set by torchrun for each process; -1 when running as a single process
+LOCAL_RANK = int(os.environ.get("LOCAL_RANK", -1))
 
 
 def log(message: str) -> None:
-    print(f"[train-gpu] {message}")
+    # Under torchrun only the main process logs, so output isn't repeated once per GPU
+    if LOCAL_RANK <= 0:
+        print(f"[train-gpu] {message}")
+
+
+@functools.lru_cache(maxsize=1)
+def _gpu_info() -> Tuple[str, int]:
+    """Name and total memory (bytes) of GPU 0, queried from the driver once per process."""
+    return torch.cuda.get_device_name(0), torch.cuda.get_device_properties(0).total_memory
 
 
 def auto_scale_batch_size(model_name: str) -> tuple[int, int, int, int]:
@@ -53,7 +68,7 @@ def auto_scale_batch_size(model_name: str) -> tuple[int, int, int, int]:
         return 2, 4, 8, 128
     
     try:
-        total_vram_gb = torch.cuda.get_device_properties(0).total_memory / (1024**3)
+        total_vram_gb = _gpu_info()[1] / (1024**3)
         log(f"Detected {total_vram_gb:.1f} GB GPU VRAM")
     except Exception as e:
         log(f"⚠️ Error detecting GPU properties: {e}")
@@ -102,54 +117,81 @@ def load_dataframe(path: Path) -> pd.DataFrame:
 def cap_per_label(df: pd.DataFrame, max_per_label: int | None) -> pd.DataFrame:
     if not max_per_label:
         return df
-    return (
-        df.groupby("label", group_keys=False)
-        .apply(lambda g: g.sample(min(len(g), max_per_label), random_state=RANDOM_STATE))
-        .reset_index(drop=True)
-    )
+    # Shuffle once, then take the first rows of each label: same as per-group sampling
+    # without replacement, but without building a sub-DataFrame per label
+    shuffled = df.sample(frac=1, random_state=RANDOM_STATE)
+    return shuffled.groupby("label", observed=True).head(max_per_label).reset_index(drop=True)
 
 
 def tokenize_function(tokenizer, max_length: int):
     def wrapper(batch):
-        return tokenizer(batch["text"], truncation=True, padding="max_length", max_length=max_length)
+        # No padding here: DataCollatorWithPadding pads each batch to its longest example
+        encoded = tokenizer(batch["text"], truncation=True, max_length=max_length)
+        # Token counts for group_by_length, so batches draw examples of similar length
+        encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+        return encoded
 
     return wrapper
 
 
+def get_tokenized(
+    texts: np.ndarray, label_ids: np.ndarray, tokenizer, max_length: int, cache_dir: Path | None
+) -> Dataset:
+    """Tokenize a split, reusing an Arrow copy on disk keyed by tokenizer, max_length and the rows themselves."""
+    if cache_dir is not None:
+        key = hashlib.blake2b(digest_size=8)
+        key.update(f"{tokenizer.name_or_path}|{max_length}".encode())
+        key.update(pd.util.hash_array(texts).tobytes())
+        key.update(label_ids.tobytes())
+        path = cache_dir / f"tok_{key.hexdigest()}"
+        if path.exists():
+            log(f"Using cached tokenized split from {path}")
+            return load_from_disk(str(path))
+
+    # Tokenize across processes; each worker runs the Rust fast tokenizer on 1000-row batches
+    num_proc = max(1, (os.cpu_count() or 1) // 2)
+    dataset = Dataset.from_dict({"text": texts, "label_id": label_ids})
+    dataset = dataset.map(tokenize_function(tokenizer, max_length), batched=True, batch_size=1000, num_proc=num_proc)
+    if cache_dir is not None and LOCAL_RANK <= 0:
+        # Save under a temporary name and rename, so other ranks never load a half-written copy
+        tmp_path = path.with_name(path.name + ".tmp")
+        # A crashed run can leave a partial .tmp behind; save_to_disk refuses to overwrite it
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        dataset.save_to_disk(str(tmp_path))
+        # os.replace cannot replace a non-empty directory, e.g. one a concurrent job just wrote
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    return dataset
+
+
 def build_datasets(
-    df: pd.DataFrame, test_size: float, max_length: int, tokenizer
+    df: pd.DataFrame, test_size: float, max_length: int, tokenizer, cache_dir: Path | None = TOKENIZED_CACHE_DIR
 ) -> Tuple[Dataset, Dataset, Dict[int, str], np.ndarray]:
-    label_names = sorted(df["label"].unique().tolist(), key=lambda x: LABEL_ORDER.index(x))
-    label2id = {label: idx for idx, label in enumerate(label_names)}
-    id2label = {idx: label for label, idx in label2id.items()}
+    # Labels present in the data, in LABEL_ORDER; category codes are the label ids
+    present = set(df["label"].unique())
+    label_names = [label for label in LABEL_ORDER if label in present]
+    id2label = dict(enumerate(label_names))
 
-    df = df.assign(label_id=df["label"].map(label2id))
+    label_codes = pd.Categorical(df["label"], categories=label_names).codes
+    df = df.assign(label_id=label_codes.astype(np.int64))
     
-    # Compute class weights to handle imbalance
+    # Compute class weights to handle imbalance (float32 to match the loss tensor, cast once here)
     class_weights = compute_class_weight(
         class_weight='balanced',
         classes=np.unique(df["label_id"]),
         y=df["label_id"]
-    )
+    ).astype(np.float32)
     log(f"Class weights: {dict(zip([id2label[i] for i in range(len(class_weights))], class_weights))}")
     
-    train_df, test_df = train_test_split(
-        df[["text", "label_id"]],
-        test_size=test_size,
-        stratify=df["label_id"],
-        random_state=RANDOM_STATE,
-    )
-
-    train_dataset = Dataset.from_pandas(train_df.reset_index(drop=True))
-    test_dataset = Dataset.from_pandas(test_df.reset_index(drop=True))
-    train_dataset = train_dataset.map(tokenize_function(tokenizer, max_length), batched=True)
-    test_dataset = test_dataset.map(tokenize_function(tokenizer, max_length), batched=True)
-    drop_cols_train = [col for col in ["text", "__index_level_0__"] if col in train_dataset.column_names]
-    drop_cols_test = [col for col in ["text", "__index_level_0__"] if col in test_dataset.column_names]
-    if drop_cols_train:
-        train_dataset = train_dataset.remove_columns(drop_cols_train)
-    if drop_cols_test:
-        test_dataset = test_dataset.remove_columns(drop_cols_test)
+    # Split row indices rather than the frame, then gather each column once per split
+    texts = df["text"].to_numpy(dtype=object)
+    label_ids = df["label_id"].to_numpy()
+    train_idx, test_idx = stratified_split(label_ids, test_size)
+
+    train_dataset = get_tokenized(texts[train_idx], label_ids[train_idx], tokenizer, max_length, cache_dir)
+    test_dataset = get_tokenized(texts[test_idx], label_ids[test_idx], tokenizer, max_length, cache_dir)
+    train_dataset = train_dataset.remove_columns("text")
+    test_dataset = test_dataset.remove_columns("text")
     train_dataset = train_dataset.rename_column("label_id", "labels")
     test_dataset = test_dataset.rename_column("label_id", "labels")
 
@@ -170,38 +212,54 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--grad-accumulation", type=int, default=4, help="Gradient accumulation steps.")
     parser.add_argument("--learning-rate", type=float, default=5e-5, help="Learning rate.")
     parser.add_argument("--max-length", type=int, default=128, help="Maximum token length.")
+    parser.add_argument("--focal-gamma", type=float, default=0.0, help="Focal loss gamma (0 = weighted cross-entropy).")
+    parser.add_argument("--grad-checkpoint", action="store_true", help="Enable gradient checkpointing (recompute activations to fit larger batches).")
+    parser.add_argument("--compile", action="store_true", help="Compile the model with torch.compile (CUDA only).")
+    parser.add_argument("--no-token-cache", action="store_true", help=f"Always re-tokenize; do not read or write {TOKENIZED_CACHE_DIR}.")
     parser.add_argument("--resume", action="store_true", help="Resume training from last checkpoint if available.")
     return parser.parse_args()
 
 
+def is_resumable_checkpoint(checkpoint: Path) -> bool:
+    """Check a checkpoint's trainer state up front so a broken one is skipped instead of failing mid-resume."""
+    try:
+        state = json.loads((checkpoint / "trainer_state.json").read_text())
+    except (OSError, ValueError) as e:
+        log(f"⚠️ Skipping {checkpoint.name}: unreadable trainer_state.json ({e})")
+        return False
+    if not isinstance(state.get("global_step"), int) or "log_history" not in state:
+        log(f"⚠️ Skipping {checkpoint.name}: trainer_state.json has an unexpected schema")
+        return False
+    return True
+
+
 class WeightedTrainer(Trainer):
-    """Custom Trainer that applies class weights to handle imbalanced datasets."""
+    """Custom Trainer that applies class weights (and optionally focal loss) to handle imbalanced datasets."""
     
-    def __init__(self, *args, class_weights=None, **kwargs):
+    def __init__(self, *args, class_weights=None, focal_gamma: float = 0.0, **kwargs):
         super().__init__(*args, **kwargs)
-        self.class_weights = None
-        if class_weights is not None:
-            # Defer weight tensor creation until we know the device
-            self._class_weights_array = class_weights
-        else:
-            self._class_weights_array = None
+        self.focal_gamma = focal_gamma
+        # Build the weight tensor once, directly on the training device
+        self.class_weights = (
+            torch.as_tensor(class_weights, dtype=torch.float32, device=self.args.device)
+            if class_weights is not None
+            else None
+        )
     
     def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
         labels = inputs.pop("labels")
         outputs = model(**inputs)
         logits = outputs.logits
         
-        # Initialize class_weights tensor on first use when device is known
-        if self.class_weights is None and self._class_weights_array is not None:
-            device = logits.device
-            self.class_weights = torch.tensor(self._class_weights_array, dtype=torch.float32).to(device)
-        
-        if self.class_weights is not None:
-            loss_fct = nn.CrossEntropyLoss(weight=self.class_weights)
-            loss = loss_fct(logits.view(-1, self.model.config.num_labels), labels.view(-1))
+        if self.focal_gamma > 0:
+            # Focal loss: scale each example's (weighted) CE by (1 - p_t)^gamma so easy examples count less
+            log_probs = F.log_softmax(logits.float(), dim=-1)
+            ce = F.nll_loss(log_probs, labels, weight=self.class_weights, reduction="none")
+            pt = log_probs.gather(1, labels.unsqueeze(1)).squeeze(1).exp()
+            loss = ((1 - pt) ** self.focal_gamma * ce).mean()
         else:
-            loss_fct = nn.CrossEntropyLoss()
-            loss = loss_fct(logits.view(-1, self.model.config.num_labels), labels.view(-1))
+            # Sequence-classification logits are already (batch, num_labels); weight=None is plain CE
+            loss = F.cross_entropy(logits, labels, weight=self.class_weights)
         
         return (loss, outputs) if return_outputs else loss
 
@@ -211,11 +269,14 @@ def main() -> None:
     
     # Auto-scale batch size by default if not explicitly set
     # Check if user provided batch size manually or should use auto-scaling
-    import sys
     manual_batch = any(arg in sys.argv for arg in ['--train-batch-size', '--eval-batch-size'])
     
     if not manual_batch or args.auto_batch:
         train_bs, eval_bs, grad_accum, max_len = auto_scale_batch_size(args.model_name)
+        if args.grad_checkpoint:
+            # Checkpointing frees most activation memory: double the per-step batch, keep the effective batch
+            train_bs *= 2
+            grad_accum = max(1, grad_accum // 2)
         args.train_batch_size = train_bs
         args.eval_batch_size = eval_bs
         args.grad_accumulation = grad_accum
@@ -233,39 +294,55 @@ def main() -> None:
     label_counts = df["label"].value_counts()
     log(f"Class distribution:\n{label_counts}")
     
-    tokenizer = AutoTokenizer.from_pretrained(args.model_name)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_name, use_fast=True)
 
-    train_dataset, test_dataset, id2label, class_weights = build_datasets(df, args.test_size, args.max_length, tokenizer)
-    label2id = {label: idx for idx, label in id2label.items()}
+    # fp32 matmuls/convs (optimizer-side and any non-autocast ops) run on TF32 tensor cores on Ampere+
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
 
-    model = AutoModelForSequenceClassification.from_pretrained(
-        args.model_name,
-        num_labels=len(id2label),
-        id2label=id2label,
-        label2id=label2id,
-    )
+    # SDPA attention dispatches to the FlashAttention / memory-efficient kernels instead of
+    # materialising the full QK^T score matrix
+    torch.backends.cuda.enable_flash_sdp(True)
+    torch.backends.cuda.enable_mem_efficient_sdp(True)
 
     # Check and configure GPU/CPU
     use_cuda = torch.cuda.is_available()
     
-    if use_cuda:
+    distributed = LOCAL_RANK != -1
+    if use_cuda and distributed:
+        # torchrun: one process per GPU; Trainer moves the model and wraps it in DistributedDataParallel
+        torch.cuda.set_device(LOCAL_RANK)
+        device = torch.device("cuda", LOCAL_RANK)
+        log(f"✓ DDP training on {int(os.environ.get('WORLD_SIZE', 1))} processes (logging from rank 0 only)")
+    elif use_cuda:
         try:
             device = torch.device("cuda")
-            log(f"✓ Using GPU: {torch.cuda.get_device_name(0)}")
-            log(f"GPU Memory: {torch.cuda.get_device_properties(0).total_memory / (1024**3):.1f} GB")
-            # Move model to GPU explicitly
-            model = model.to(device)
+            gpu_name, gpu_memory = _gpu_info()
+            log(f"✓ Using GPU: {gpu_name}")
+            log(f"GPU Memory: {gpu_memory / (1024**3):.1f} GB")
         except Exception as e:
             log(f"⚠️ Error initializing GPU: {e}")
             log("Falling back to CPU")
             use_cuda = False
             device = torch.device("cpu")
-            model = model.to(device)
     else:
         device = torch.device("cpu")
         log("⚠️ GPU not available; training will run on CPU (much slower)")
         log("To use GPU, install PyTorch with CUDA support: pip install torch --index-url https://download.pytorch.org/whl/cu118")
-        model = model.to(device)
+
+    # Inductor fuses LayerNorm/residual/GELU into fewer kernels. Trainer compiles the model itself (and
+    # saves the uncompiled weights); dynamic padding yields several sequence shapes, so allow more recompiles
+    use_compile = args.compile and use_cuda and hasattr(torch, "compile")
+    if use_compile:
+        torch._dynamo.config.cache_size_limit = 64
+        log("Compiling model with torch.compile (mode=reduce-overhead)")
+
+    # Collate in worker processes and pin host buffers so batch copies overlap the GPU step;
+    # Windows lacks fork, so stay in-process there
+    num_workers = 0 if sys.platform == "win32" else min(8, os.cpu_count() or 1)
+
+    # bf16 on Ampere/Ada: fp16 throughput without loss scaling or overflow-skipped steps
+    bf16_ok = use_cuda and torch.cuda.is_bf16_supported()
 
     training_args = TrainingArguments(
         output_dir=str(args.output_dir),
@@ -274,22 +351,63 @@ def main() -> None:
         per_device_eval_batch_size=args.eval_batch_size,
         num_train_epochs=args.epochs,
         weight_decay=0.01,
-        eval_strategy="epoch",
-        save_strategy="epoch",
-        save_total_limit=3,  # Keep only last 3 checkpoints to save disk space
+        # Evaluate/save every 1000 steps and keep the best plus the latest checkpoint,
+        # so checkpoint writes don't compete with data loading for disk bandwidth
+        eval_strategy="steps",
+        eval_steps=1000,
+        save_strategy="steps",
+        save_steps=1000,
+        save_total_limit=2,
         logging_strategy="steps",
         logging_steps=100,
         gradient_accumulation_steps=args.grad_accumulation,
+        gradient_checkpointing=args.grad_checkpoint,
+        gradient_checkpointing_kwargs={"use_reentrant": False} if args.grad_checkpoint else None,
+        group_by_length=True,  # Length-homogeneous batches keep dynamic padding small
+        length_column_name="length",
         load_best_model_at_end=True,
         metric_for_best_model="accuracy",
+        ignore_data_skip=True,  # On resume, start the epoch's data fresh instead of replaying skipped batches
         report_to="none",
-        fp16=use_cuda,  # Only use fp16 if CUDA is available
+        bf16=bf16_ok,
+        fp16=use_cuda and not bf16_ok,  # fp16 only on CUDA GPUs without bf16 support
+        tf32=bf16_ok,  # TF32 needs Ampere+, the same GPUs that support bf16
         auto_find_batch_size=True,  # Auto-reduce batch size if OOM
         save_safetensors=True,  # Use safetensors format
+        dataloader_pin_memory=use_cuda,
+        dataloader_num_workers=num_workers,
+        dataloader_persistent_workers=num_workers > 0,
+        torch_compile=use_compile,
+        torch_compile_mode="reduce-overhead" if use_compile else None,
+        ddp_find_unused_parameters=False,  # Every parameter gets a gradient; skip the per-step graph walk
+        ddp_bucket_cap_mb=50,
+        ddp_broadcast_buffers=False,  # BERT's buffers (position ids) never change
         no_cuda=not use_cuda,  # Use CPU if CUDA not available
     )
 
-    data_collator = DataCollatorWithPadding(tokenizer=tokenizer)
+    # Under torchrun, rank 0 tokenizes (and writes the tokenized-split cache) while the other
+    # ranks wait, then they load rank 0's copy instead of all tokenizing at once
+    with training_args.main_process_first(desc="tokenization"):
+        train_dataset, test_dataset, id2label, class_weights = build_datasets(
+            df, args.test_size, args.max_length, tokenizer, cache_dir=None if args.no_token_cache else TOKENIZED_CACHE_DIR
+        )
+    label2id = {label: idx for idx, label in id2label.items()}
+
+    model = AutoModelForSequenceClassification.from_pretrained(
+        args.model_name,
+        num_labels=len(id2label),
+        id2label=id2label,
+        label2id=label2id,
+        attn_implementation="sdpa",
+    )
+    if args.grad_checkpoint:
+        model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+
+    if not distributed:
+        # Move model to the device explicitly (under DDP the Trainer does it per rank)
+        model = model.to(device)
+
+    data_collator = DataCollatorWithPadding(tokenizer=tokenizer, pad_to_multiple_of=8)
 
     def compute_metrics(eval_pred):
         logits, labels = eval_pred
@@ -308,26 +426,22 @@ def main() -> None:
         data_collator=data_collator,
         compute_metrics=compute_metrics,
         class_weights=class_weights,
+        focal_gamma=args.focal_gamma,
     )
 
     # Check for existing checkpoints to resume from
     resume_from_checkpoint = None
     if args.resume and args.output_dir.exists():
-        checkpoints = list(args.output_dir.glob("checkpoint-*"))
-        if checkpoints:
-            # Sort by modification time and get the latest
-            latest_checkpoint = max(checkpoints, key=lambda p: p.stat().st_mtime)
+        # Newest first; take the first checkpoint whose trainer state is valid
+        checkpoints = sorted(args.output_dir.glob("checkpoint-*"), key=lambda p: p.stat().st_mtime, reverse=True)
+        latest_checkpoint = next((c for c in checkpoints if is_resumable_checkpoint(c)), None)
+        if latest_checkpoint is not None:
             resume_from_checkpoint = str(latest_checkpoint)
             log(f"Found checkpoint: {latest_checkpoint.name}. Resuming training...")
         else:
-            log("No checkpoint found. Starting training from scratch.")
+            log("No usable checkpoint found. Starting training from scratch.")
     
-    try:
-        trainer.train(resume_from_checkpoint=resume_from_checkpoint)
-    except Exception as e:
-        log(f"Error during training with checkpoint resume: {e}")
-        log("Retrying training from scratch...")
-        trainer.train()
+    trainer.train(resume_from_checkpoint=resume_from_checkpoint)
     metrics = trainer.evaluate()
     log(f"Evaluation metrics: {metrics}")
 